@@ -2,12 +2,15 @@
 """Back-port compiler for Python 3.8 positional-only parameter syntax."""
 
 import argparse
+import functools
 import os
 import pathlib
 import re
+import shutil
 import sys
+import tempfile
 import traceback
-from typing import Generator, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar, Union, cast
 
 import f2format
 import parso.python.tree
@@ -15,13 +18,12 @@ import parso.tree
 import tbtrim
 from bpc_utils import (BaseContext, BPCSyntaxError, Config, TaskLock, archive_files,
                        detect_encoding, detect_files, detect_indentation, detect_linesep,
-                       first_non_none, get_parso_grammar_versions, map_tasks, parse_boolean_state,
-                       parse_indentation, parse_linesep, parse_positive_integer, parso_parse,
-                       recover_files)
+                       get_parso_grammar_versions, map_tasks, parse_boolean_state, parse_indentation,
+                       parse_linesep, parse_positive_integer, parso_parse, recover_files)
 from bpc_utils.typing import Linesep
 from typing_extensions import Literal, final
 
-__all__ = ['main', 'poseur', 'convert', 'decorator']  # pylint: disable=undefined-all-variable
+__all__ = ['main', 'poseur', 'convert', 'decorator', 'clear_cache']
 
 # version string
 __version__ = '0.4.3.post1'
@@ -29,6 +31,11 @@ __version__ = '0.4.3.post1'
 ###############################################################################
 # Typings
 
+T = TypeVar('T')
+#: Memo of :meth:`Context.has_expr` results keyed by node identity. The node itself
+#: is kept alongside the result so that its identity cannot be reused.
+HasExprMemo = Dict[int, Tuple[parso.tree.NodeOrLeaf, bool]]
+
 
 class PoseurConfig(Config):
     indentation = ''  # type: str
@@ -38,6 +45,7 @@ class PoseurConfig(Config):
     source_version = None  # Optional[str]
     decorator = 'decorator'  # type: str
     dismiss = False  # type: bool
+    has_expr_memo = None  # type: Optional[HasExprMemo]
 
 
 ##############################################################################
@@ -69,12 +77,42 @@ _default_pep8 = True
 _default_dismiss = False
 #: Default value for the ``decorator-name`` option.
 _default_decorator = '_poseur_decorator'
+#: Default value for the ``cache`` option.
+_default_cache = False
+
+#: Minimum number of files to dispatch to worker processes when the
+#: ``concurrency`` option is *auto detect*; smaller batches are converted
+#: sequentially to save the pool start-up cost.
+_parallel_threshold = 8
 
 # option getter utility functions
 # option value precedence is: explicit value (CLI/API arguments) > environment variable > default value
 
 
-def _get_quiet_option(explicit: Optional[bool] = None) -> Optional[bool]:
+def _get_boolean_option(explicit: Optional[bool], envvar: str, default: bool) -> bool:
+    """Get the value for a boolean option.
+
+    Args:
+        explicit (Optional[bool]): the value explicitly specified by user,
+            :data:`None` if not specified
+        envvar (str): name of the environment variable for the option
+        default (bool): default value for the option
+
+    Returns:
+        bool: the value for the option
+
+    """
+    # short circuit evaluation, i.e. a ?? b ?? c with PEP 505, so that the
+    # environment variable is only looked up if not specified explicitly
+    if explicit is not None:
+        return explicit
+    environ = parse_boolean_state(os.getenv(envvar))
+    if environ is not None:
+        return environ
+    return default
+
+
+def _get_quiet_option(explicit: Optional[bool] = None) -> bool:
     """Get the value for the ``quiet`` option.
 
     Args:
@@ -91,13 +129,7 @@ def _get_quiet_option(explicit: Optional[bool] = None) -> Optional[bool]:
         :data:`_default_quiet`
 
     """
-    # We need short circuit evaluation, so first_non_none(a, b, c) does not work here
-    # with PEP 505 we can simply write a ?? b ?? c
-    def _option_layers() -> Generator[Optional[bool], None, None]:
-        yield explicit
-        yield parse_boolean_state(os.getenv('POSEUR_QUIET'))
-        yield _default_quiet
-    return first_non_none(_option_layers())
+    return _get_boolean_option(explicit, 'POSEUR_QUIET', _default_quiet)
 
 
 def _get_concurrency_option(explicit: Optional[int] = None) -> Optional[int]:
@@ -121,7 +153,7 @@ def _get_concurrency_option(explicit: Optional[int] = None) -> Optional[int]:
     return parse_positive_integer(explicit or os.getenv('POSEUR_CONCURRENCY') or _default_concurrency)
 
 
-def _get_do_archive_option(explicit: Optional[bool] = None) -> Optional[bool]:
+def _get_do_archive_option(explicit: Optional[bool] = None) -> bool:
     """Get the value for the ``do_archive`` option.
 
     Args:
@@ -138,11 +170,7 @@ def _get_do_archive_option(explicit: Optional[bool] = None) -> Optional[bool]:
         :data:`_default_do_archive`
 
     """
-    def _option_layers() -> Generator[Optional[bool], None, None]:
-        yield explicit
-        yield parse_boolean_state(os.getenv('POSEUR_DO_ARCHIVE'))
-        yield _default_do_archive
-    return first_non_none(_option_layers())
+    return _get_boolean_option(explicit, 'POSEUR_DO_ARCHIVE', _default_do_archive)
 
 
 def _get_archive_path_option(explicit: Optional[str] = None) -> str:
@@ -165,7 +193,7 @@ def _get_archive_path_option(explicit: Optional[str] = None) -> str:
     return explicit or os.getenv('POSEUR_ARCHIVE_PATH') or _default_archive_path
 
 
-def _get_source_version_option(explicit: Optional[str] = None) -> Optional[str]:
+def _get_source_version_option(explicit: Optional[str] = None) -> str:
     """Get the value for the ``source_version`` option.
 
     Args:
@@ -227,7 +255,7 @@ def _get_indentation_option(explicit: Optional[Union[str, int]] = None) -> Optio
     return parse_indentation(explicit or os.getenv('POSEUR_INDENTATION') or _default_indentation)
 
 
-def _get_pep8_option(explicit: Optional[bool] = None) -> Optional[bool]:
+def _get_pep8_option(explicit: Optional[bool] = None) -> bool:
     """Get the value for the ``pep8`` option.
 
     Args:
@@ -244,14 +272,10 @@ def _get_pep8_option(explicit: Optional[bool] = None) -> Optional[bool]:
         :data:`_default_pep8`
 
     """
-    def _option_layers() -> Generator[Optional[bool], None, None]:
-        yield explicit
-        yield parse_boolean_state(os.getenv('POSEUR_PEP8'))
-        yield _default_pep8
-    return first_non_none(_option_layers())
+    return _get_boolean_option(explicit, 'POSEUR_PEP8', _default_pep8)
 
 
-def _get_dismiss_option(explicit: Optional[bool] = None) -> Optional[bool]:
+def _get_dismiss_option(explicit: Optional[bool] = None) -> bool:
     """Get the value for the ``dismiss-runtime`` option.
 
     Args:
@@ -268,14 +292,10 @@ def _get_dismiss_option(explicit: Optional[bool] = None) -> Optional[bool]:
         :data:`_default_dismiss`
 
     """
-    def _option_layers() -> Generator[Optional[bool], None, None]:
-        yield explicit
-        yield parse_boolean_state(os.getenv('POSEUR_DISMISS'))
-        yield _default_dismiss
-    return first_non_none(_option_layers())
+    return _get_boolean_option(explicit, 'POSEUR_DISMISS', _default_dismiss)
 
 
-def _get_decorator_option(explicit: Optional[str] = None) -> Optional[str]:
+def _get_decorator_option(explicit: Optional[str] = None) -> str:
     """Get the value for the ``decorator`` option.
 
     Args:
@@ -295,6 +315,26 @@ def _get_decorator_option(explicit: Optional[str] = None) -> Optional[str]:
     return explicit or os.getenv('POSEUR_DECORATOR') or _default_decorator
 
 
+def _get_cache_option(explicit: Optional[bool] = None) -> bool:
+    """Get the value for the ``cache`` option.
+
+    Args:
+        explicit (Optional[bool]): the value explicitly specified by user,
+            :data:`None` if not specified
+
+    Returns:
+        bool: the value for the ``cache`` option
+
+    :Environment Variables:
+        :envvar:`POSEUR_CACHE` -- the value in environment variable
+
+    See Also:
+        :data:`_default_cache`
+
+    """
+    return _get_boolean_option(explicit, 'POSEUR_CACHE', _default_cache)
+
+
 ###############################################################################
 # Traceback Trimming (tbtrim)
 
@@ -329,10 +369,11 @@ def %(decorator)s(*poseur):
 %(indentation)s
 %(indentation)s"""
 %(indentation)simport functools
+%(indentation)sposeur_names = frozenset(poseur)
 %(indentation)sdef caller(func):
 %(indentation)s%(indentation)s@functools.wraps(func)
 %(indentation)s%(indentation)sdef wrapper(*args, **kwargs):
-%(indentation)s%(indentation)s%(indentation)sposeur_args = set(poseur).intersection(kwargs)
+%(indentation)s%(indentation)s%(indentation)sposeur_args = poseur_names.intersection(kwargs)
 %(indentation)s%(indentation)s%(indentation)sif poseur_args:
 %(indentation)s%(indentation)s%(indentation)s%(indentation)sraise TypeError('%%s() got some positional-only arguments passed as keyword arguments: %%r' %% (func.__name__, ', '.join(poseur_args)))
 %(indentation)s%(indentation)s%(indentation)sreturn func(*args, **kwargs)
@@ -341,6 +382,29 @@ def %(decorator)s(*poseur):
 '''.splitlines()  # `str.splitlines` will remove trailing newline
 
 
+@functools.lru_cache(maxsize=32)
+def _render_decorator(decorator: str, indentation: str, linesep: Linesep) -> str:
+    """Render the runtime checks decorator function.
+
+    Args:
+        decorator (str): name of the decorator function
+        indentation (str): indentation sequence
+        linesep (Linesep): line separator
+
+    Returns:
+        str: source code rendered from :data:`DECORATOR_TEMPLATE`
+
+    The rendered code only depends on the arguments, thus it is cached
+    rather than re-rendered for every conversion.
+
+    """
+    code = linesep.join(DECORATOR_TEMPLATE) % dict(
+        decorator=decorator,
+        indentation=indentation,
+    )  # type: str
+    return code
+
+
 class Context(BaseContext):
     """General conversion context.
 
@@ -414,8 +478,15 @@ class Context(BaseContext):
       * :meth:`Context._process_fstring`
 
     """
-    #: re.Pattern: Pattern to find the function definition line.
-    pattern_funcdef = re.compile(r'^\s*(async\s+)?def\s', re.ASCII)
+    #: re.Pattern: Pattern to find the function definition line, i.e. the first
+    #: line (separated by any of LF, CRLF and CR) starting with ``def`` or ``async def``.
+    pattern_funcdef = re.compile(r'(?:^|(?<=\r))[ \t\f]*(async[ \t\f]+)?def\s', re.ASCII | re.MULTILINE)
+    #: Dict[Linesep, re.Pattern]: Patterns to find the leading line separators
+    #: of a code snippet, keyed by the line separator.
+    pattern_linesep = {
+        linesep: re.compile(r'^(?P<linesep>(?:%s)*)' % linesep, re.ASCII)
+        for linesep in ('\n', '\r\n', '\r')
+    }  # type: Dict[Linesep, re.Pattern[str]]
 
     @final
     @property
@@ -436,6 +507,9 @@ class Context(BaseContext):
         #: we might need to *mangle* and/or *normalize* variable names
         #: in certain scenario.
         self._cls_ctx = clx_ctx  # type: Optional[str]
+        #: Optional[HasExprMemo]: Memo of :meth:`~Context.has_expr` results,
+        #: shared over the contexts of a single conversion through ``config``.
+        self._has_expr_memo = getattr(config, 'has_expr_memo', None)  # type: Optional[HasExprMemo]
 
         super().__init__(node, config, indent_level=indent_level, raw=raw)
 
@@ -457,7 +531,7 @@ class Context(BaseContext):
         ``node``.
 
         """
-        if not self.has_expr(node):
+        if not self.has_expr(node, memo=self._has_expr_memo):
             self += node.get_code()
             return
 
@@ -472,6 +546,126 @@ class Context(BaseContext):
                       indent_level=indent, raw=True)
         self += ctx.string.lstrip()
 
+    def _process_parameters(self,
+                            nodes: List[parso.tree.NodeOrLeaf]) -> Tuple[List[str], List[parso.python.tree.Param]]:
+        """Process parameter list of function or lambda definitions.
+
+        Args:
+            nodes (List[parso.tree.NodeOrLeaf]): parameter and operator nodes in the list
+
+        Returns:
+            Tuple[List[str], List[parso.python.tree.Param]]: a tuple of the converted
+            parameter list code, split at the top-level commas, and the positional-only
+            parameters
+
+        This method walks ``nodes`` once, both collecting the parameters before
+        the ``/`` operator and building the parameter list code with the ``/``
+        operator removed. Parameters whose annotation or default value contains
+        positional-only parameters are converted through another :class:`Context`
+        instance, others are kept as is.
+
+        As the code is split at the commas seen on the parameter list itself,
+        commas inside default values (e.g. tuples or strings) are preserved as is.
+
+        """
+        segments = []  # type: List[str]
+        segment = ''
+        posonly = []  # type: List[parso.python.tree.Param]
+        param_list = []  # type: List[parso.python.tree.Param]
+        for child in nodes:
+            if child.type == 'operator':
+                operator = cast(parso.tree.Leaf, child)
+
+                # <Operator: />
+                if operator.value == '/':
+                    segment += operator.prefix
+                    posonly.extend(param_list)
+                    continue
+
+                # <Operator: ,>
+                if operator.value == ',':
+                    segments.append(segment + operator.prefix)
+                    segment = ''
+                    continue
+
+            # <Param: ...>
+            if child.type == 'param':
+                param = cast(parso.python.tree.Param, child)
+                param_list.append(param)
+
+                # only initiate new context if the annotation or default value needs conversion
+                if self.has_expr(param, memo=self._has_expr_memo):
+                    ctx = Context(param, self.config, raw=True,  # type: ignore[arg-type]
+                                  indent_level=self._indent_level)
+                    code = ctx.string
+                else:
+                    code = param.get_code()
+
+                # <Param: ...,> includes its trailing <Operator: ,>
+                comma = cast(parso.tree.Leaf, param.children[-1])
+                if comma.type == 'operator' and comma.value == ',':
+                    segments.append(segment + code[:-1])
+                    segment = ''
+                    continue
+                segment += code
+                continue
+
+            # <Operator: *>
+            segment += child.get_code()
+        segments.append(segment)
+        return segments, posonly
+
+    def _join_params(self, segments: List[str]) -> str:
+        """Join parameter list code segments.
+
+        Args:
+            segments (List[str]): parameter list code split at the top-level commas
+
+        Returns:
+            str: the joined parameter list code
+
+        Empty segments (e.g. left over by the removed ``/`` operator) are dropped,
+        and segments with only comments or backslash continuations are appended
+        to the previous one. If :attr:`self._pep8 <poseur.Context._pep8>` is
+        :data:`True`, the segments are stripped (see :meth:`~poseur.Context._strip_segment`)
+        and joined with ``', '``; otherwise they are joined with ``','`` as is.
+
+        """
+        merged = []  # type: List[str]
+        for segment in segments:
+            if not segment.strip():
+                continue
+            if merged and all(not line.strip() or line.lstrip().startswith('#') or line.strip() == '\\'
+                              for line in segment.splitlines()):
+                merged[-1] += segment
+                continue
+            merged.append(segment)
+
+        if self._pep8:
+            return ', '.join(map(self._strip_segment, merged))
+        return ','.join(merged)
+
+    @staticmethod
+    def _strip_segment(segment: str) -> str:
+        """Strip a parameter list code segment.
+
+        Args:
+            segment (str): parameter list code segment
+
+        Returns:
+            str: the stripped code segment
+
+        The line break ending a trailing comment or backslash continuation is
+        kept, so that the code joined after the segment is not swallowed by it.
+
+        """
+        code = segment.strip()
+        last_line = code.splitlines()[-1] if code else ''
+        if '#' in last_line or last_line.endswith('\\'):
+            trailing = segment[len(segment.rstrip()):]
+            code += trailing[:max(trailing.rfind('\n'), trailing.rfind('\r')) + 1]
+        return code
+
     def _process_funcdef(self, node: parso.python.tree.Function, *,
                          async_ctx: Optional[parso.python.tree.Keyword] = None) -> None:
         """Process function definition (:token:`funcdef`).
@@ -483,66 +677,40 @@ class Context(BaseContext):
             async_ctx (Optional[parso.python.tree.Keyword]): ``async`` keyword AST node
 
         """
-        if not self.has_expr(node):
+        if not self.has_expr(node, memo=self._has_expr_memo):
             self += node.get_code()
             return
 
-        posonly = []  # positional-only parameters
+        posonly = []  # type: List[parso.python.tree.Param]
         funcdef = '' if async_ctx is None else async_ctx.get_code()
 
         # 'def' NAME '(' PARAM ')' [ '->' NAME ] ':' SUITE
         for child in node.children[:-1]:
             if child.type == 'parameters':
+                children = cast(parso.tree.BaseNode, child).children
+
                 # <Operator: (>
-                funcdef += child.children[0].get_code()
-
-                parameters = ''
-                param_list = []  # type: List[parso.python.tree.Param]
-                for grandchild in child.children[1:-1]:
-                    # <Operator: />
-                    if grandchild.type == 'operator' and grandchild.value == '/':
-                        parameters += grandchild.get_code().replace('/', '')
-                        posonly.extend(param_list)
-                        continue
-
-                    # <Param: ...>
-                    if grandchild.type == 'param':
-                        param_list.append(grandchild)
-
-                        if grandchild.default is not None:
-                            # initiate new context
-                            ctx = Context(grandchild, self.config, raw=True,  # type: ignore[arg-type]
-                                          indent_level=self._indent_level)
-                            parameters += ctx.string
-                            continue
-
-                    # <Param: ...> / <Operator: *> / <Operator: ,>
-                    parameters += grandchild.get_code()
-
-                if self._pep8:
-                    funcdef += ', '.join(filter(None, map(lambda s: s.strip(), parameters.split(','))))
-                else:
-                    funcdef += ','.join(filter(lambda s: s.strip(), parameters.split(',')))
+                lpar = cast(parso.tree.Leaf, children[0])
+                funcdef += lpar.prefix + lpar.value
+
+                parameters, posonly = self._process_parameters(children[1:-1])
+                funcdef += self._join_params(parameters)
 
                 # <Operator: )>
-                funcdef += child.children[-1].get_code()
+                rpar = cast(parso.tree.Leaf, children[-1])
+                funcdef += rpar.prefix + rpar.value
                 continue
 
             funcdef += child.get_code()
 
         # decorate the function
         if not self._dismiss and posonly:
-            prefix = ''
-            suffix = ''
-            deflag = False  # function definition line
-
-            for line in funcdef.splitlines(True):
-                if self.pattern_funcdef.match(line) is not None:
-                    deflag = True
-                if deflag:
-                    suffix += line
-                else:
-                    prefix += line
+            # split at the function definition line
+            match = self.pattern_funcdef.search(funcdef)
+            if match is None:
+                prefix, suffix = funcdef, ''
+            else:
+                prefix, suffix = funcdef[:match.start()], funcdef[match.start():]
 
             posonly_args = ', '.join(map(lambda param: repr(self.normalizer(param.name.value)), posonly))
             indentation = self._indentation * self._indent_level
@@ -606,75 +774,44 @@ class Context(BaseContext):
             node (parso.python.tree.Lambda): lambda node
 
         """
-        if not self.has_expr(node):
+        if not self.has_expr(node, memo=self._has_expr_memo):
             self += node.get_code()
             return
 
-        pos_only = []
-        children = iter(node.children)
-
-        # string buffers
-        params = ''
-        prefix = ''
-        suffix = ''
-
         # <Keyword: lambda>
-        prefix += next(children).get_code()
+        keyword = cast(parso.tree.Leaf, node.children[0])
+        prefix = keyword.prefix + keyword.value
 
         # vararglist
-        param_list = []  # type: List[parso.python.tree.Param]
-        for child in children:
-            if child.type == 'operator':
-                # <Operator: />
-                if child.value == '/':
-                    params += child.get_code().replace('/', '')
-                    pos_only.extend(param_list)
-                    continue
+        params, pos_only = self._process_parameters(node.children[1:-2])
 
-                # <Operator: :>
-                if child.value == ':':
-                    suffix += child.get_code()
-                    break
-
-            # <Param: ...>
-            if child.type == 'param':
-                param_list.append(child)
-
-                if child.default is not None:
-                    # initialize new context
-                    ctx = Context(node=child, config=self.config,  # type: ignore[arg-type]
-                                  indent_level=self._indent_level, raw=True)
-                    params += ctx.string
-                    continue
-
-            # <Param: ...> / <Operator: *> / <Operator: ,>
-            params += child.get_code()
+        # <Operator: :>
+        colon = cast(parso.tree.Leaf, node.children[-2])
+        suffix = colon.prefix + colon.value
 
         # test_nocond | test
-        ctx = Context(node=next(children), config=self.config,  # type: ignore[arg-type]
+        ctx = Context(node=node.children[-1], config=self.config,  # type: ignore[arg-type]
                       indent_level=self._indent_level, raw=True)
         suffix += ctx.string
 
-        whitespace_prefix, whitespace_suffix = self.extract_whitespaces(params)
-        if self._pep8:
-            params = ', '.join(filter(None, map(lambda s: s.strip(), params.split(','))))
-        else:
-            params = ','.join(filter(lambda s: s.strip(), params.split(',')))
-        lambdef = prefix + whitespace_prefix + params.strip() + suffix.lstrip()
+        whitespace_prefix, _ = self._extract_whitespaces(params[0])
+        # keep the line break after a trailing comment or backslash continuation
+        lambdef = prefix + whitespace_prefix + self._strip_segment(self._join_params(params)) + suffix.lstrip()
 
         if self._dismiss or not pos_only:
             self += lambdef
             return
 
         # decorate lambda definition
-        whitespace_prefix, whitespace_suffix = self.extract_whitespaces(lambdef)
+        whitespace_prefix, whitespace_suffix = self._extract_whitespaces(lambdef)
+        lambdef = lambdef[len(whitespace_prefix):len(lambdef) - len(whitespace_suffix)]
         posonly_args = ', '.join(map(lambda param: repr(self.normalizer(param.name.value).strip()), pos_only))
         self += ('%(prefix)s'
                  '%(decorator)s(%(posonly)s)'
                  '(%(lambdef)s)'
                  '%(suffix)s') % dict(
                      prefix=whitespace_prefix, suffix=whitespace_suffix,
-                     lambdef=lambdef.strip(),
+                     lambdef=lambdef,
                      decorator=self._decorator, posonly=posonly_args,
                  )
 
@@ -704,7 +841,7 @@ class Context(BaseContext):
             context, rather than the new :class:`StringContext` instance.
 
         """
-        if not self.has_expr(node):
+        if not self.has_expr(node, memo=self._has_expr_memo):
             self += node.get_code()
             return
 
@@ -945,69 +1082,126 @@ class Context(BaseContext):
         in compliance with :pep:`8`.
 
         """
-        if self._dismiss or not self.has_expr(self._root):
+        if self._dismiss or not self.has_expr(self._root, memo=self._has_expr_memo):
             self._buffer += self._prefix + self._suffix
             return
 
         # strip suffix comments
-        prefix, suffix = self.split_comments(self._suffix, self._linesep)
-        match = re.match(r'^(?P<linesep>(%s)*)' % self._linesep, suffix, flags=re.ASCII)
-        suffix_linesep = match.group('linesep') if match is not None else ''
+        prefix, suffix = self._split_comments(self._suffix, self._linesep)
+        # the pattern also matches the empty string, so it never fails
+        suffix_linesep = self.pattern_linesep[self._linesep].match(suffix).group('linesep')  # type: ignore[union-attr]
+
+        # collect the chunks and join them once, rather than
+        # copying the whole buffer on each concatenation
+        buffer = []  # type: List[str]
 
         # first, the prefix code
-        self._buffer += self._prefix + prefix + suffix_linesep
-        if self._pep8 and self._buffer:
+        code = self._buffer + self._prefix + prefix + suffix_linesep
+        buffer.append(code)
+        if self._pep8 and code:
             if (self._node_before_expr is not None
                     and self._node_before_expr.type in ('funcdef', 'classdef')
                     and self._indent_level == 0):
                 blank = 2
             else:
                 blank = 1
-            self._buffer += self._linesep * self.missing_newlines(prefix=self._buffer, suffix='',
-                                                                  expected=blank, linesep=self._linesep)
+            buffer.append(self._linesep * self.missing_newlines(prefix=code, suffix='',
+                                                                expected=blank, linesep=self._linesep))
 
         # then, the decorator function
-        self._buffer += self._linesep.join(DECORATOR_TEMPLATE) % dict(
-            decorator=self._decorator,
-            indentation=self._indentation,
-        ) + self._linesep
+        code = _render_decorator(self._decorator, self._indentation, self._linesep) + self._linesep
+        buffer.append(code)
 
         # finally, the suffix code
         if self._pep8:
-            self._buffer += self._linesep * self.missing_newlines(prefix=self._buffer, suffix='',
-                                                                  expected=2, linesep=self._linesep)
-        self._buffer += suffix.lstrip(self._linesep)
+            # the decorator code is never blank, so its trailing lines are the buffer's
+            buffer.append(self._linesep * self.missing_newlines(prefix=code, suffix='',
+                                                                expected=2, linesep=self._linesep))
+        buffer.append(suffix.lstrip(self._linesep))
+        self._buffer = ''.join(buffer)
 
     @final
     @classmethod
-    def has_expr(cls, node: parso.tree.NodeOrLeaf) -> bool:
+    def has_expr(cls, node: parso.tree.NodeOrLeaf, *, memo: Optional[HasExprMemo] = None) -> bool:
         """Check if node has positional-only parameters.
 
         Args:
             node (parso.tree.NodeOrLeaf): parso AST
 
+        Keyword Args:
+            memo (Optional[HasExprMemo]): memo of previous results to look up and update
+
+        Returns:
+            bool: if ``node`` has positional-only parameters
+
+        The AST is traversed with an explicit stack rather than recursion,
+        returning as soon as any positional-only parameters are found. If ``memo``
+        is given, results are memoized in it; the contexts of a conversion share
+        the memo created by :func:`~poseur._convert` for that conversion only.
+
+        Leaves (e.g. literal or name default values) never contain positional-only
+        parameters, so they are answered directly without touching the memo.
+
+        """
+        if not hasattr(node, 'children'):
+            return False
+        if memo is None:
+            return cls._has_expr(node, None)
+
+        cached = memo.get(id(node))
+        if cached is not None:
+            return cached[1]
+
+        flag = cls._has_expr(node, memo)
+        memo[id(node)] = (node, flag)
+        return flag
+
+    # backward compatibility and auxiliary alias
+    has_poseur = has_expr
+
+    @final
+    @classmethod
+    def _has_expr(cls, node: parso.tree.NodeOrLeaf, memo: Optional[HasExprMemo]) -> bool:
+        """Check if node has positional-only parameters, bypassing the memo for ``node`` itself.
+
+        Args:
+            node (parso.tree.NodeOrLeaf): parso AST
+            memo (Optional[HasExprMemo]): memo passed on to checks of nested nodes
+
         Returns:
             bool: if ``node`` has positional-only parameters
 
         """
         if node.type == 'funcdef':
-            return cls._check_funcdef(node)  # type: ignore[arg-type]
+            return cls._check_funcdef(node, memo)  # type: ignore[arg-type]
         if node.type == 'lambdef':
-            return cls._check_lambdef(node)  # type: ignore[arg-type]
-        if hasattr(node, 'children'):
-            return any(map(cls.has_expr, node.children))  # type: ignore[attr-defined]
+            return cls._check_lambdef(node, memo)  # type: ignore[arg-type]
+        if not isinstance(node, parso.tree.BaseNode):
+            return False
+
+        # leaves never contain positional-only parameters, so only
+        # nodes with children are pushed onto the stack to be expanded
+        stack = [node]
+        while stack:
+            for child in stack.pop().children:
+                if child.type == 'funcdef':
+                    if cls._check_funcdef(cast(parso.python.tree.Function, child), memo):
+                        return True
+                elif child.type == 'lambdef':
+                    if cls._check_lambdef(cast(parso.python.tree.Lambda, child), memo):
+                        return True
+                elif isinstance(child, parso.tree.BaseNode):
+                    stack.append(child)
         return False
 
-    # backward compatibility and auxiliary alias
-    has_poseur = has_expr
-
     @final
     @classmethod
-    def _check_funcdef(cls, node: parso.python.tree.Function) -> bool:
+    def _check_funcdef(cls, node: parso.python.tree.Function, memo: Optional[HasExprMemo] = None) -> bool:
         """Check if :term:`function` definition contains positional-only parameters.
 
         Args:
             node (parso.python.tree.Function): function definition
+            memo (Optional[HasExprMemo]): memo of :meth:`~Context.has_expr` results
 
         Returns:
             bool: if :term:`function` definition contains positional-only parameters
@@ -1015,45 +1209,89 @@ class Context(BaseContext):
         """
         for child in node.children:
             if child.type == 'parameters':
-                for param in child.children[1:-1]:
-                    if param.type == 'operator':
-                        if param.value == '/':
-                            return True
-                        continue
-                    if param.default is not None and cls.has_expr(param.default):
+                params = cast(parso.tree.BaseNode, child).children[1:-1]
+                # look for the (cheap) '/' marker first, before descending
+                # into any of the annotations and default values
+                for param in params:
+                    if param.type == 'operator' and cast(parso.tree.Leaf, param).value == '/':
                         return True
-            elif cls.has_expr(child):  # suite / ...
+                for param in params:
+                    if param.type == 'param' and cls.has_expr(param, memo=memo):
+                        return True
+            elif cls.has_expr(child, memo=memo):  # suite / ...
                 return True
         return False
 
     @final
     @classmethod
-    def _check_lambdef(cls, node: parso.python.tree.Lambda) -> bool:
+    def _check_lambdef(cls, node: parso.python.tree.Lambda, memo: Optional[HasExprMemo] = None) -> bool:
         """Check if :term:`lambda` definition contains positional-only parameters.
 
         Args:
             node (parso.python.tree.Lambda): lambda definition
+            memo (Optional[HasExprMemo]): memo of :meth:`~Context.has_expr` results
 
         Returns:
             bool: if :term:`lambda` definition contains positional-only parameters
 
         """
-        param = False
-        suite = False
-        for child in node.children:
-            if child.type == 'param':
-                if child.default is not None:
-                    if cls.has_expr(child.default):
-                        return True
-                param = True
-            elif child.type == 'operator' and child.value == ':':
-                param = False
-                suite = True
-            elif param and child.type == 'operator' and child.value == '/':
+        # 'lambda' [varargslist] ':' test
+        params = node.children[1:-2]
+        for param in params:
+            if param.type == 'operator' and cast(parso.tree.Leaf, param).value == '/':
                 return True
-            elif suite and cls.has_expr(child):
+        for param in params:
+            if param.type == 'param' and cls.has_expr(param, memo=memo):
                 return True
-        return False
+        return cls.has_expr(node.children[-1], memo=memo)
+
+    @final
+    @staticmethod
+    def _split_comments(code: str, linesep: Linesep) -> Tuple[str, str]:
+        """Separates prefixing comments from code.
+
+        Args:
+            code (str): the code to split comments
+            linesep (Linesep): line seperator
+
+        Returns:
+            Tuple[str, str]: a tuple of *prefix comments* and *suffix code*
+
+        This method is equivalent to :meth:`~bpc_utils.BaseContext.split_comments`,
+        but scans ``code`` line by line for the first non-comment line and slices
+        it there, instead of splitting all lines and concatenating them one by one,
+        which is quadratic on large modules.
+
+        """
+        start = 0
+        while True:
+            end = code.find(linesep, start)
+            line = code[start:] if end == -1 else code[start:end]
+            if not line.strip().startswith('#'):
+                return code[:start], code[start:]
+            if end == -1:
+                return code, ''
+            start = end + len(linesep)
+
+    @final
+    @staticmethod
+    def _extract_whitespaces(code: str) -> Tuple[str, str]:
+        """Extract preceding and succeeding whitespaces from the code given.
+
+        Args:
+            code (str): the code to extract whitespaces
+
+        Returns:
+            Tuple[str, str]: a tuple of *preceding* and *succeeding* whitespaces in ``code``
+
+        This method is equivalent to :meth:`~bpc_utils.BaseContext.extract_whitespaces`,
+        but slices ``code`` by the lengths of its stripped forms, instead of
+        accumulating the whitespace characters one by one.
+
+        """
+        prefix = code[:len(code) - len(code.lstrip(' \t\n\r\f'))]
+        suffix = code[len(code.rstrip(' \t\n\r\f')):]
+        return prefix, suffix
 
     @final
     def normalizer(self, name: str) -> str:
@@ -1101,8 +1339,9 @@ class StringContext(Context):
     def __init__(self, node: parso.python.tree.PythonNode, config: PoseurConfig, *,
                  clx_ctx: Optional[str] = None, indent_level: int = 0, raw: Literal[True] = True):
         # convert using f2format first
-        prefix, suffix = self.extract_whitespaces(node.get_code())
-        code = f2format.convert(node.get_code().strip())
+        code = node.get_code()
+        prefix, suffix = self._extract_whitespaces(code)
+        code = f2format.convert(code[len(prefix):len(code) - len(suffix)])
         node = parso_parse(code, filename=config.filename, version=config.source_version)
 
         # call super init
@@ -1114,13 +1353,95 @@ class StringContext(Context):
 ###############################################################################
 # Public Interface
 
-exec(os.linesep.join(DECORATOR_TEMPLATE) % dict(decorator='decorator', indentation='    '))  # nosec: B102; pylint: disable=exec-used
+
+def decorator(*poseur: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Positional-only parameters runtime checker.
+
+    Args:
+        *poseur: Name list of positional-only parameters.
+
+    Raises:
+        TypeError: If any position-only parameters were passed as
+            keyword parameters.
+
+    The decorator function may decorate regular :term:`function` and/or
+    :term:`lambda` function to provide runtime checks on the original
+    positional-only parameters.
+
+    """
+    poseur_names = frozenset(poseur)
+
+    def caller(func: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(func)
+        def wrapper(*args: object, **kwargs: object) -> T:
+            poseur_args = poseur_names.intersection(kwargs)
+            if poseur_args:
+                raise TypeError('%s() got some positional-only arguments passed as keyword arguments: %r'
+                                % (func.__name__, ', '.join(poseur_args)))
+            return func(*args, **kwargs)
+        return wrapper
+    return caller
+
+
+#: re.Pattern: Pattern to pre-filter source code that may contain positional-only
+#: parameters, i.e. a ``/`` followed by ``,``, ``)`` or ``:`` with only whitespaces,
+#: comments and line continuations in between. This rules out most divisions.
+_posonly_marker = re.compile(r'/(?:\s|\\|#[^\r\n]*)*[,):]')
+
+
+def _convert(code: Union[str, bytes], filename: Optional[str], source_version: Optional[str],
+             linesep: Linesep, indentation: str, pep8: bool, dismiss: bool, decorator: str) -> str:
+    """Convert the given Python source code string with resolved options.
+
+    Args:
+        code (Union[str, bytes]): the source code to be converted
+        filename (Optional[str]): an optional source file name to provide a context in case of error
+        source_version (Optional[str]): parse the code as this Python version
+        linesep (Linesep): line separator of code
+        indentation (str): code indentation style
+        pep8 (bool): whether to make code insertion :pep:`8` compliant
+        dismiss (bool): whether to dismiss runtime checks for positional-only parameters
+        decorator (str): name of decorator for runtime checks
+
+    Returns:
+        str: converted source code
+
+    """
+    # parse source string
+    module = parso_parse(code, filename=filename, version=source_version)
+
+    # positional-only parameters cannot appear without the marker, so
+    # skip the conversion walk entirely for the (common) modules without one
+    if isinstance(code, bytes):
+        has_marker = b'/' in code  # the encoding may not be ASCII compatible
+    else:
+        has_marker = _posonly_marker.search(code) is not None
+    if not has_marker:
+        result = module.get_code()  # type: str
+        return result
+
+    # pack conversion configuration
+    config = Config(linesep=linesep, indentation=indentation, pep8=pep8,
+                    filename=filename, source_version=source_version,
+                    dismiss=dismiss, decorator=decorator, has_expr_memo={})
+
+    # convert source string
+    result = Context(module, config).string  # type: ignore[arg-type]
+
+    # return conversion result
+    return result
+
+
+#: :func:`_convert` with an in-process LRU cache, used when the ``cache``
+#: option is enabled; all resolved options are part of the cache key.
+_convert_cached = functools.lru_cache(maxsize=128)(_convert)
 
 
 def convert(code: Union[str, bytes], filename: Optional[str] = None, *,
             source_version: Optional[str] = None, linesep: Optional[Linesep] = None,
             indentation: Optional[Union[int, str]] = None, pep8: Optional[bool] = None,
-            dismiss: Optional[bool] = None, decorator: Optional[str] = None) -> str:
+            dismiss: Optional[bool] = None, decorator: Optional[str] = None,
+            cache: Optional[bool] = None) -> str:
     """Convert the given Python source code string.
 
     Args:
@@ -1133,6 +1454,8 @@ def convert(code: Union[str, bytes], filename: Optional[str] = None, *,
         indentation (Optional[Union[int, str]]): code indentation style, specify an integer for the number of spaces,
             or ``'t'``/``'tab'`` for tabs (auto detect by default)
         pep8 (Optional[bool]): whether to make code insertion :pep:`8` compliant
+        cache (Optional[bool]): whether to cache conversion results in-process, keyed by the code and
+            all resolved options (reset with :func:`clear_cache`)
 
     :Environment Variables:
      - :envvar:`POSEUR_SOURCE_VERSION` -- same as the ``source_version`` argument and the ``--source-version`` option
@@ -1142,6 +1465,7 @@ def convert(code: Union[str, bytes], filename: Optional[str] = None, *,
      - :envvar:`POSEUR_PEP8` -- same as the ``pep8`` argument and the ``--no-pep8`` option in CLI (logical negation)
      - :envvar:`POSEUR_DISMISS` -- same as the ``--dismiss-runtime`` option in CLI
      - :envvar:`POSEUR_DECORATOR` -- same as the ``--decorator-name`` option in CLI
+     - :envvar:`POSEUR_CACHE` -- same as the ``cache`` argument
 
     Returns:
         str: converted source code
@@ -1150,11 +1474,8 @@ def convert(code: Union[str, bytes], filename: Optional[str] = None, *,
         ValueError: if ``decorator`` is not a valid identifier name or starts with double underscore
 
     """
-    # parse source string
+    # get source version, linesep, indentation and pep8 options
     source_version = _get_source_version_option(source_version)
-    module = parso_parse(code, filename=filename, version=source_version)
-
-    # get linesep, indentation and pep8 options
     linesep = _get_linesep_option(linesep)
     indentation = _get_indentation_option(indentation)
     if linesep is None:
@@ -1173,23 +1494,79 @@ def convert(code: Union[str, bytes], filename: Optional[str] = None, *,
     if decorator.startswith('__'):
         raise ValueError('name of decorator for runtime checks should not start with double underscore')
 
-    # pack conversion configuration
-    config = Config(linesep=linesep, indentation=indentation, pep8=pep8,
-                    filename=filename, source_version=source_version,
-                    dismiss=dismiss, decorator=decorator)
+    # convert with the fully resolved options, which makes up the cache key
+    func = _convert_cached if _get_cache_option(cache) else _convert
+    return func(code, filename, source_version, linesep, indentation, pep8, dismiss, decorator)
 
-    # convert source string
-    result = Context(module, config).string  # type: ignore[arg-type]
 
-    # return conversion result
-    return result
+def clear_cache() -> None:
+    """Clear the in-process cache of conversion results.
+
+    See Also:
+        The ``cache`` argument of :func:`convert` and :envvar:`POSEUR_CACHE`.
+
+    """
+    _convert_cached.cache_clear()
+
+
+def _overwrite_file(filename: str, content: bytes) -> None:
+    """Atomically overwrite a file with the given content.
+
+    Args:
+        filename (str): the file to overwrite
+        content (bytes): the new file content
+
+    The content is first written to a temporary file in the same directory,
+    which then replaces the original file with :func:`os.replace`, so that
+    the original file is never left partially written.
+
+    Note:
+        The replacing file is a new inode: only the permission bits of the
+        original file are carried over, while its owner, group, ACLs and extended
+        attributes are not. Files with multiple hard links, and files whose
+        directory does not allow creating the temporary file, are therefore
+        overwritten in place instead.
+
+    """
+    path = os.path.realpath(filename)
+    if os.stat(path).st_nlink > 1:  # replacing would break the hard links
+        _write_file(path, content)
+        return
+
+    try:
+        fd, temp = tempfile.mkstemp(prefix='.%s.' % os.path.basename(path), suffix='.tmp',
+                                    dir=os.path.dirname(path))
+    except OSError:  # e.g. writable file in a read-only directory
+        _write_file(path, content)
+        return
+
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+        shutil.copymode(path, temp)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+def _write_file(filename: str, content: bytes) -> None:
+    """Overwrite a file in place with the given content.
+
+    Args:
+        filename (str): the file to overwrite
+        content (bytes): the new file content
+
+    """
+    with open(filename, 'wb') as file:
+        file.write(content)
 
 
 def poseur(filename: str, *, source_version: Optional[str] = None, linesep: Optional[Linesep] = None,
            indentation: Optional[Union[int, str]] = None, pep8: Optional[bool] = None,
            dismiss: Optional[bool] = None, decorator: Optional[str] = None,
-           quiet: Optional[bool] = None, dry_run: bool = False) -> None:
-    """Convert the given Python source code file. The file will be overwritten.
+           cache: Optional[bool] = None, quiet: Optional[bool] = None, dry_run: bool = False) -> None:
+    """Convert the given Python source code file. The file will be overwritten if the conversion changes it.
 
     Args:
         filename (str): the file to convert
@@ -1200,6 +1577,7 @@ def poseur(filename: str, *, source_version: Optional[str] = None, linesep: Opti
         indentation (Optional[Union[int, str]]): code indentation style, specify an integer for the number of spaces,
             or ``'t'``/``'tab'`` for tabs (auto detect by default)
         pep8 (Optional[bool]): whether to make code insertion :pep:`8` compliant
+        cache (Optional[bool]): whether to cache conversion results in-process
         quiet (Optional[bool]): whether to run in quiet mode
         dry_run (bool): if :data:`True`, only print the name of the file to convert but do not perform any conversion
 
@@ -1212,6 +1590,7 @@ def poseur(filename: str, *, source_version: Optional[str] = None, linesep: Opti
      - :envvar:`POSEUR_QUIET` -- same as the ``quiet`` argument and the ``--quiet`` option in CLI
      - :envvar:`POSEUR_DISMISS` -- same as the ``--dismiss-runtime`` option in CLI
      - :envvar:`POSEUR_DECORATOR` -- same as the ``--decorator-name`` option in CLI
+     - :envvar:`POSEUR_CACHE` -- same as the ``cache`` argument
 
     """
     quiet = _get_quiet_option(quiet)
@@ -1225,57 +1604,127 @@ def poseur(filename: str, *, source_version: Optional[str] = None, linesep: Opti
     with open(filename, 'rb') as file:
         content = file.read()
 
-    # detect source code encoding
+    # detect source code encoding and decode the content once
     encoding = detect_encoding(content)
+    text = content.decode(encoding)
 
     # get linesep and indentation
     linesep = _get_linesep_option(linesep)
     indentation = _get_indentation_option(indentation)
-    if linesep is None or indentation is None:
-        with open(filename, 'r', encoding=encoding) as file:
-            if linesep is None:
-                linesep = detect_linesep(file)
-            if indentation is None:
-                indentation = detect_indentation(file)
+    if linesep is None:
+        linesep = detect_linesep(text)
+    if indentation is None:
+        indentation = detect_indentation(text)
 
     # do the dirty things
-    result = convert(content, filename=filename, source_version=source_version,
+    result = convert(text, filename=filename, source_version=source_version,
                      linesep=linesep, indentation=indentation, pep8=pep8,
-                     dismiss=dismiss, decorator=decorator)
+                     dismiss=dismiss, decorator=decorator, cache=cache)
 
-    # overwrite the file with conversion result
-    with open(filename, 'w', encoding=encoding, newline='') as file:
-        file.write(result)
+    # overwrite the file with conversion result, leaving unchanged files
+    # (and their modification times) untouched
+    if result != text:
+        _overwrite_file(filename, result.encode(encoding))
 
 
 ###############################################################################
 # CLI & Entry Point
 
-# option values display
-# these values are only intended for argparse help messages
-# this shows default values by default, environment variables may override them
-__cwd__ = os.getcwd()
-__poseur_quiet__ = 'quiet mode' if _get_quiet_option() else 'non-quiet mode'
-__poseur_concurrency__ = _get_concurrency_option() or 'auto detect'
-__poseur_do_archive__ = 'will do archive' if _get_do_archive_option() else 'will not do archive'
-__poseur_archive_path__ = os.path.join(__cwd__, _get_archive_path_option())
-__poseur_source_version__ = _get_source_version_option()
-__poseur_linesep__ = {
+#: Dict[Optional[Linesep], str]: Display names of the ``linesep`` option values
+#: for argparse help messages.
+_linesep_names = {
     '\n': 'LF',
     '\r\n': 'CRLF',
     '\r': 'CR',
     None: 'auto detect'
-}[_get_linesep_option()]
-__poseur_indentation__ = _get_indentation_option()
-if __poseur_indentation__ is None:
-    __poseur_indentation__ = 'auto detect'
-elif __poseur_indentation__ == '\t':
-    __poseur_indentation__ = 'tab'
-else:
-    __poseur_indentation__ = '%d spaces' % len(__poseur_indentation__)
-__poseur_pep8__ = 'will conform to PEP 8' if _get_pep8_option() else 'will not conform to PEP 8'
-__poseur_dismiss__ = 'will dismiss runtime checks' if _get_dismiss_option() else 'will not dismiss runtime checks'
-__poseur_decorator__ = _get_decorator_option() or '_poseur_decorator'
+}  # type: Dict[Optional[Linesep], str]
+
+
+def _format_indentation(indentation: Optional[str]) -> str:
+    """Format the ``indentation`` option value for argparse help messages.
+
+    Args:
+        indentation (Optional[str]): the indentation option value
+
+    Returns:
+        str: display name of the indentation, e.g. ``'tab'`` or ``'4 spaces'``
+
+    """
+    if indentation is None:
+        return 'auto detect'
+    if indentation == '\t':
+        return 'tab'
+    return '%d spaces' % len(indentation)
+
+
+def _get_option_display() -> Dict[str, object]:
+    """Resolve the current option values for argparse help messages.
+
+    Returns:
+        Dict[str, object]: display values of the options, keyed by option name (and
+        ``'cwd'`` for the current working directory)
+
+    The values are resolved from the environment variables and default values
+    upon each call.
+
+    """
+    cwd = os.getcwd()
+    return dict(
+        cwd=cwd,
+        quiet='quiet mode' if _get_quiet_option() else 'non-quiet mode',
+        concurrency=_get_concurrency_option() or 'auto detect',
+        do_archive='will do archive' if _get_do_archive_option() else 'will not do archive',
+        archive_path=os.path.join(cwd, _get_archive_path_option()),
+        source_version=_get_source_version_option(),
+        linesep=_linesep_names[_get_linesep_option()],
+        indentation=_format_indentation(_get_indentation_option()),
+        pep8='will conform to PEP 8' if _get_pep8_option() else 'will not conform to PEP 8',
+        dismiss='will dismiss runtime checks' if _get_dismiss_option() else 'will not dismiss runtime checks',
+        decorator=_get_decorator_option() or '_poseur_decorator',
+    )
+
+
+#: Dict[str, str]: Deprecated module attributes for the option values display,
+#: mapped to their keys in :func:`_get_option_display`.
+_deprecated_globals = {
+    '__cwd__': 'cwd',
+    '__poseur_quiet__': 'quiet',
+    '__poseur_concurrency__': 'concurrency',
+    '__poseur_do_archive__': 'do_archive',
+    '__poseur_archive_path__': 'archive_path',
+    '__poseur_source_version__': 'source_version',
+    '__poseur_linesep__': 'linesep',
+    '__poseur_indentation__': 'indentation',
+    '__poseur_pep8__': 'pep8',
+    '__poseur_dismiss__': 'dismiss',
+    '__poseur_decorator__': 'decorator',
+}
+
+
+def __getattr__(name: str) -> object:
+    """Resolve the deprecated option values display attributes upon access.
+
+    Args:
+        name (str): attribute name
+
+    Returns:
+        object: the current display value of the option
+
+    Raises:
+        AttributeError: if ``name`` is not a deprecated attribute
+
+    """
+    if name not in _deprecated_globals:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    return _get_option_display()[_deprecated_globals[name]]
+
+
+# module __getattr__ (PEP 562) is only supported since Python 3.7,
+# so resolve the deprecated attributes once at import time before that
+if sys.version_info < (3, 7):
+    _display = _get_option_display()
+    globals().update((name, _display[key]) for name, key in _deprecated_globals.items())
+    del _display
 
 
 def get_parser() -> argparse.ArgumentParser:
@@ -1284,15 +1733,24 @@ def get_parser() -> argparse.ArgumentParser:
     Returns:
         argparse.ArgumentParser: CLI parser for poseur
 
+    The *current* option values shown in the help messages are resolved
+    from the environment variables and default values upon each call,
+    rather than once at import time.
+
     """
+    # option values display
+    # these values are only intended for argparse help messages
+    # this shows default values by default, environment variables may override them
+    display = _get_option_display()
+
     parser = argparse.ArgumentParser(prog='poseur',
                                      usage='poseur [options] <Python source files and directories...>',
                                      description='Back-port compiler for Python 3.8 position-only parameters.')
     parser.add_argument('-V', '--version', action='version', version=__version__)
     parser.add_argument('-q', '--quiet', action='store_true', default=None,
-                        help='run in quiet mode (current: %s)' % __poseur_quiet__)
+                        help='run in quiet mode (current: %s)' % display['quiet'])
     parser.add_argument('-C', '--concurrency', action='store', type=int, metavar='N',
-                        help='the number of concurrent processes for conversion (current: %s)' % __poseur_concurrency__)
+                        help='the number of concurrent processes for conversion (current: %s)' % display['concurrency'])
     parser.add_argument('--dry-run', action='store_true',
                         help='list the files to be converted without actually performing conversion and archiving')
     parser.add_argument('-s', '--simple', action='store', nargs='?', dest='simple_args', const='', metavar='FILE',
@@ -1306,8 +1764,8 @@ def get_parser() -> argparse.ArgumentParser:
     archive_group = parser.add_argument_group(title='archive options',
                                               description="backup original files in case there're any issues")
     archive_group.add_argument('-na', '--no-archive', action='store_false', dest='do_archive', default=None,
-                               help='do not archive original files (current: %s)' % __poseur_do_archive__)
-    archive_group.add_argument('-k', '--archive-path', action='store', default=__poseur_archive_path__, metavar='PATH',
+                               help='do not archive original files (current: %s)' % display['do_archive'])
+    archive_group.add_argument('-k', '--archive-path', action='store', default=display['archive_path'], metavar='PATH',
                                help='path to archive original files (current: %(default)s)')
     archive_group.add_argument('-r', '--recover', action='store', dest='recover_file', metavar='ARCHIVE_FILE',
                                help='recover files from a given archive file')
@@ -1318,20 +1776,20 @@ def get_parser() -> argparse.ArgumentParser:
     # TODO: revise ``--dismiss-runtime`` & ``--decorator-name`` options
     convert_group = parser.add_argument_group(title='convert options', description='conversion configuration')
     convert_group.add_argument('-vs', '-vf', '--source-version', '--from-version', action='store', metavar='VERSION',
-                               default=__poseur_source_version__, choices=POSEUR_SOURCE_VERSIONS,
+                               default=display['source_version'], choices=POSEUR_SOURCE_VERSIONS,
                                help='parse source code as this Python version (current: %(default)s)')
     convert_group.add_argument('-l', '--linesep', action='store',
                                help='line separator (LF, CRLF, CR) to read '
-                                    'source files (current: %s)' % __poseur_linesep__)
+                                    'source files (current: %s)' % display['linesep'])
     convert_group.add_argument('-t', '--indentation', action='store', metavar='INDENT',
                                help='code indentation style, specify an integer for the number of spaces, '
-                                    "or 't'/'tab' for tabs (current: %s)" % __poseur_indentation__)
+                                    "or 't'/'tab' for tabs (current: %s)" % display['indentation'])
     convert_group.add_argument('-n8', '--no-pep8', action='store_false', dest='pep8', default=None,
-                               help='do not make code insertion PEP 8 compliant (current: %s)' % __poseur_pep8__)
+                               help='do not make code insertion PEP 8 compliant (current: %s)' % display['pep8'])
     convert_group.add_argument('-nr', '--dismiss-runtime', action='store_true', dest='dismiss', default=None,
-                               help='dismiss runtime checks for positional-only parameters (current: %s)' % __poseur_dismiss__)  # pylint: disable=line-too-long
+                               help='dismiss runtime checks for positional-only parameters (current: %s)' % display['dismiss'])  # pylint: disable=line-too-long
     convert_group.add_argument('-d', '--decorator-name', action='store', dest='decorator', metavar='NAME',
-                               default=__poseur_decorator__, help='name of decorator for runtime checks (current: %s)' % __poseur_decorator__)  # pylint: disable=line-too-long
+                               default=display['decorator'], help='name of decorator for runtime checks (current: %s)' % display['decorator'])  # pylint: disable=line-too-long
 
     parser.add_argument('files', action='store', nargs='*', metavar='<Python source files and directories...>',
                         help='Python source files and directories to be converted')
@@ -1339,6 +1797,40 @@ def get_parser() -> argparse.ArgumentParser:
     return parser
 
 
+def _get_cpu_count() -> int:
+    """Get the number of CPUs available to the current process.
+
+    Returns:
+        int: the number of usable CPUs
+
+    The CPU affinity mask (e.g. as set by ``taskset`` or cgroups cpusets) is
+    respected where supported, rather than counting all configured CPUs.
+
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _get_file_size(filename: str) -> int:
+    """Get the size of a file for scheduling purposes.
+
+    Args:
+        filename (str): the file to get size of
+
+    Returns:
+        int: size of the file in bytes, or ``0`` if it cannot be accessed
+
+    Files that vanished or became inaccessible after being detected are
+    not reported here, but by the conversion of such file later on.
+
+    """
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
 def do_poseur(filename: str, **kwargs: object) -> None:
     """Wrapper function to catch exceptions."""
     try:
@@ -1366,32 +1858,36 @@ def main(argv: Optional[List[str]] = None) -> int:
      - :envvar:`POSEUR_PEP8` -- same as the ``--no-pep8`` option in CLI (logical negation)
      - :envvar:`POSEUR_DISMISS` -- same as the ``--dismiss-runtime`` option in CLI
      - :envvar:`POSEUR_DECORATOR` -- same as the ``--decorator-name`` option in CLI
+     - :envvar:`POSEUR_CACHE` -- cache conversion results in-process
 
     """
     parser = get_parser()
     args = parser.parse_args(argv)
 
-    options = {
-        'source_version': args.source_version,
-        'linesep': args.linesep,
-        'indentation': args.indentation,
-        'pep8': args.pep8,
-        'dismiss': args.dismiss,
-        'decorator': args.decorator,
-    }
+    # resolve conversion options once, rather than per file in each worker
+    source_version = _get_source_version_option(args.source_version)
+    linesep = _get_linesep_option(args.linesep)
+    indentation = _get_indentation_option(args.indentation)
+    pep8 = _get_pep8_option(args.pep8)
+    dismiss = _get_dismiss_option(args.dismiss)
+    decorator_name = _get_decorator_option(args.decorator)
+    cache = _get_cache_option()
 
     # check if running in simple mode
     if args.simple_args is not None:
         if args.files:
             parser.error('no Python source files or directories shall be given as positional arguments in simple mode')
+        filename = None  # type: Optional[str]
         if not args.simple_args:  # read from stdin
-            code = sys.stdin.read()
+            code = sys.stdin.read()  # type: Union[str, bytes]
         else:  # read from file
             filename = args.simple_args
-            options['filename'] = filename
             with open(filename, 'rb') as file:
                 code = file.read()
-        sys.stdout.write(convert(code, **options))  # print conversion result to stdout
+        # print conversion result to stdout
+        sys.stdout.write(convert(code, filename, source_version=source_version, linesep=linesep,
+                                 indentation=indentation, pep8=pep8, dismiss=dismiss,
+                                 decorator=decorator_name, cache=cache))
         return 0
 
     # get options
@@ -1431,11 +1927,39 @@ def main(argv: Optional[List[str]] = None) -> int:
         archive_files(filelist, archive_path)
 
     # process files
-    options.update({
+    options = {
+        'source_version': source_version,
+        'linesep': linesep,
+        'indentation': indentation,
+        'pep8': pep8,
+        'dismiss': dismiss,
+        'decorator': decorator_name,
+        'cache': cache,
         'quiet': quiet,
         'dry_run': args.dry_run,
-    })
-    map_tasks(do_poseur, filelist, kwargs=options, processes=processes)
+    }  # type: Dict[str, object]
+
+    # convert small batches in-process unless concurrency is explicitly requested,
+    # and never start more workers than there are files
+    if processes is None:
+        processes = 1 if len(filelist) < _parallel_threshold else _get_cpu_count()
+    processes = min(processes, len(filelist))
+
+    # dispatch larger files first to reduce the tail latency, and
+    # send files in chunks to cut down per-file IPC round-trips
+    if not args.dry_run:
+        filelist = sorted(filelist, key=_get_file_size, reverse=True)
+    chunksize = max(1, len(filelist) // (processes * 4))
+
+    # load the grammar before workers are forked, so that they
+    # inherit the cached instance rather than each loading its own;
+    # an invalid version is left to fail per file in do_poseur()
+    if not args.dry_run:
+        try:
+            parso.load_grammar(version=source_version)
+        except (ValueError, NotImplementedError):
+            pass
+    map_tasks(do_poseur, filelist, kwargs=options, processes=processes, chunksize=chunksize)
 
     return 0
 
@@ -1,72 +1,77 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=no-member, redefined-outer-name
 
+import ast
 import contextlib
+import inspect
+import io
 import os
-import subprocess
+import runpy
 import sys
 import tempfile
+import textwrap
 import unittest
+from unittest import mock
 
 # root path
 ROOT = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, os.path.abspath(os.path.join(ROOT, '..')))
 #from poseur import ConvertError, _decorator, convert, decorator, get_parser
+from bpc_utils import BaseContext
 from bpc_utils import BPCSyntaxError as ConvertError
 from poseur import DECORATOR_TEMPLATE as _decorator
-from poseur import convert, decorator, get_parser  # pylint: disable=no-name-in-module
+from poseur import Context, _overwrite_file
+from poseur import _convert_cached, clear_cache, convert, decorator, get_parser  # pylint: disable=no-name-in-module
 from poseur import main as main_func
 from poseur import poseur as core_func
+import poseur as poseur_module
 sys.path.pop(0)
 
 # macros
-with open(os.path.join(ROOT, 'sample.py')) as file:
+with open(os.path.join(ROOT, 'sample.py'), 'rb') as file:
     CODE = file.read()
 with open(os.path.join(ROOT, 'sample.txt')) as file:
     TEXT = file.read()
 
-# environs
-os.environ['POSEUR_DECORATOR'] = '_poseur_decorator'
-os.environ['POSEUR_QUIET'] = 'true'
-os.environ['POSEUR_LINESEP'] = 'LF'
+# environs (applied per test, leaving the ambient environment untouched)
+ENVIRON = {
+    'POSEUR_DECORATOR': '_poseur_decorator',
+    'POSEUR_QUIET': 'true',
+    'POSEUR_LINESEP': 'LF',
+}
 POSEUR_LINESEP = '\n'
 
 
 @contextlib.contextmanager
 def test_environ(path, *env):
-    with open(path, 'w') as file:
+    with open(path, 'wb') as file:
         file.write(CODE)
-    _env = dict()
-    for var in env:
-        _env[var] = os.environ.get(var)
-        os.environ[var] = 'true'
-
-    try:
+    with mock.patch.dict(os.environ, {var: 'true' for var in env}):
         yield
-    finally:
-        pass
-
-    for var in env:
-        if _env[var] is None:
-            del os.environ[var]
-        else:
-            os.environ[var] = _env[var]
-    with open(path, 'w') as file:
-        file.write(CODE)
 
 
+@mock.patch.dict(os.environ, ENVIRON)
 class TestPoseur(unittest.TestCase):
 
     def __init__(self, methodName):
         self.maxDiff = None
         super().__init__(methodName)
 
+    @classmethod
+    def setUpClass(cls):
+        # one scratch directory for the whole class, each test uses its own file
+        cls._tempdir = tempfile.TemporaryDirectory()
+        cls.tempdir = cls._tempdir.name
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._tempdir.cleanup()
+
     def _check_output(self, path):
-        output = subprocess.check_output(
-            [sys.executable, path],
-            universal_newlines=True
-        )
-        self.assertEqual(output, TEXT)
+        # run the converted script in-process rather than spawning an interpreter
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            runpy.run_path(path, run_name='__main__')
+        self.assertEqual(output.getvalue(), TEXT)
 
     def _check_convert(self, src, dst):
         out = convert(src)
@@ -90,6 +95,16 @@ class TestPoseur(unittest.TestCase):
         self.assertEqual(args.files, ['test1.py', 'test2.py'],
                          'python source files and folders to be converted')
 
+    @unittest.skipIf(sys.version_info < (3, 7), 'module __getattr__ requires Python 3.7')
+    def test_deprecated_globals(self):
+        # resolved upon access rather than at import time
+        with mock.patch.dict(os.environ, {'POSEUR_QUIET': 'false'}):
+            self.assertEqual(poseur_module.__poseur_quiet__, 'non-quiet mode')
+        self.assertEqual(poseur_module.__poseur_quiet__, 'quiet mode')
+        self.assertEqual(poseur_module.__cwd__, os.getcwd())
+        with self.assertRaises(AttributeError):
+            poseur_module.__poseur_unknown__  # pylint: disable=pointless-statement
+
     def test_convert(self):
         # error conversion
         os.environ['POSEUR_SOURCE_VERSION'] = '3.7'
@@ -97,32 +112,164 @@ class TestPoseur(unittest.TestCase):
             convert('def func(a, /, b, *, c): pass')
         del os.environ['POSEUR_SOURCE_VERSION']
 
+        # comments and backslash continuations around the removed operator
+        for src in ['func = (lambda a,  # comment\n /: a)\n',
+                    'func = (lambda a, \\\n /: a)\n',
+                    'func = lambda a, \\\n /: a\n']:
+            for pep8 in (True, False):
+                out = convert(src, pep8=pep8)
+                self.assertIn("_poseur_decorator('a')(lambda a", out)
+                compile(out, '<test_convert>', 'exec')
+
+    def test_marker(self):
+        # no marker, returned as is without walking the module
+        src = 'def func(a,   b):\r\n\tpass  # comment\r\n\n\n\nx = (1,\n     2)\n'
+        with mock.patch('poseur.Context') as context:
+            self.assertEqual(convert(src), src)
+            self.assertEqual(convert(src.encode()), src)
+        context.assert_not_called()
+
+        # slashes only in strings, comments and divisions
+        src = "x = 1 / 2\ny = '/, '\n# def func(a, /, b): pass\ndef func(a, b): return a / b\n"
+        self.assertEqual(convert(src), src)
+        self.assertEqual(convert(src.encode()), src)
+
+        # marker split by a comment or a backslash continuation
+        for src in ['def func(a, / # comment\n, b): pass\n',
+                    'def func(a, /\\\n, b): pass\n',
+                    'func = lambda a, /  \\\n  : a\n']:
+            for code in (src, src.encode()):
+                out = convert(code)
+                self.assertIn("_poseur_decorator('a')", out)
+                compile(out, '<test_marker>', 'exec')
+
+    def test_cache(self):
+        src = 'def func(a, /): pass'
+        clear_cache()
+
+        # disabled by default
+        convert(src)
+        self.assertEqual(_convert_cached.cache_info().currsize, 0)
+
+        with mock.patch.dict(os.environ, {'POSEUR_CACHE': 'true'}):
+            out = convert(src)
+            self.assertEqual(convert(src), out)
+            self.assertEqual(_convert_cached.cache_info().hits, 1)
+
+            # options are part of the cache key
+            self.assertNotEqual(convert(src, dismiss=True), out)
+            self.assertEqual(_convert_cached.cache_info().misses, 2)
+
+        # explicit argument takes precedence over the environment
+        convert(src, cache=True)
+        self.assertEqual(_convert_cached.cache_info().hits, 2)
+
+        clear_cache()
+        self.assertEqual(_convert_cached.cache_info().currsize, 0)
+
     def test_core(self):
-        with tempfile.TemporaryDirectory() as tempdir:
-            path = os.path.join(tempdir, 'test.py')
+        path = os.path.join(self.tempdir, 'test_core.py')
 
-            # --dismiss
-            with test_environ(path, 'POSEUR_DISMISS'):
-                core_func(path)
-                self._check_output(path)
+        # --dismiss
+        with test_environ(path, 'POSEUR_DISMISS'):
+            core_func(path)
+            self._check_output(path)
 
-            # --linting
-            with test_environ(path, 'POSEUR_LINTING'):
-                core_func(path)
-                self._check_output(path)
+        # --linting
+        with test_environ(path, 'POSEUR_LINTING'):
+            core_func(path)
+            self._check_output(path)
+
+        # converted files are not rewritten
+        os.utime(path, (0, 0))
+        core_func(path)
+        self.assertEqual(os.stat(path).st_mtime, 0)
+
+        # changed files are rewritten
+        with open(path, 'ab') as file:
+            file.write(b'\ndef func(a, /): pass\n')
+        os.utime(path, (0, 0))
+        core_func(path)
+        self.assertNotEqual(os.stat(path).st_mtime, 0)
+        self._check_output(path)
+
+    def test_overwrite(self):
+        path = os.path.join(self.tempdir, 'test_overwrite.py')
+        with open(path, 'wb') as file:
+            file.write(b'old')
+        os.chmod(path, 0o640)
+
+        # permission bits are preserved
+        _overwrite_file(path, b'new')
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'new')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+
+        # a failed write leaves the original file and no temporary file behind
+        with mock.patch('os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                _overwrite_file(path, b'failed')
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'new')
+        self.assertEqual([name for name in os.listdir(self.tempdir) if name.startswith('.test_overwrite.py.')], [])
+
+        # hard links are kept by writing in place
+        link = os.path.join(self.tempdir, 'test_overwrite_link.py')
+        os.link(path, link)
+        _overwrite_file(path, b'linked')
+        with open(link, 'rb') as file:
+            self.assertEqual(file.read(), b'linked')
+        os.remove(link)
+
+        # fall back to writing in place if no temporary file can be created
+        with mock.patch('tempfile.mkstemp', side_effect=PermissionError):
+            _overwrite_file(path, b'in place')
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'in place')
+        os.remove(path)
 
     def test_main(self):
-        with tempfile.TemporaryDirectory() as tempdir:
-            path = os.path.join(tempdir, 'test.py')
-            with open(path, 'w') as file:
-                file.write(CODE)
-
-            with open(os.devnull, 'w') as devnull:
-                with contextlib.redirect_stdout(devnull):
-                    os.environ['POSEUR_QUIET'] = 'false'
-                    main_func(['-na', path])
-                os.environ['POSEUR_QUIET'] = 'true'
-            self._check_output(path)
+        path = os.path.join(self.tempdir, 'test_main.py')
+        with open(path, 'wb') as file:
+            file.write(CODE)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with mock.patch.dict(os.environ, {'POSEUR_QUIET': 'false'}):
+                main_func(['-na', path])
+        self._check_output(path)
+
+        # files vanished after detection fail on their own
+        missing = os.path.join(self.tempdir, 'test_main_missing.py')
+        with mock.patch('poseur.detect_files', return_value=[path, missing]):
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertEqual(main_func(['-na', path]), 0)
+        self.assertIn('Failed to convert file: %r' % missing, stderr.getvalue())
+
+        # invalid source versions fail per file rather than aborting the run
+        with mock.patch.dict(os.environ, {'POSEUR_SOURCE_VERSION': 'invalid'}):
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertEqual(main_func(['-na', path]), 0)
+        self.assertIn('Failed to convert file: %r' % path, stderr.getvalue())
+
+    def test_context_helpers(self):
+        # equivalent to the bpc_utils implementations
+        for code, linesep in [('', '\n'),
+                              ('# comment', '\n'),
+                              ('# comment\n', '\n'),
+                              ('# a\n  # b\n\n', '\n'),
+                              ('# a\n\n# b\nx = 1  # c\n', '\n'),
+                              ('x = 1\n# comment\n', '\n'),
+                              ('# a\r\n# b\r\nx = 1\r\n', '\r\n'),
+                              ('# a\r\n', '\r\n'),
+                              ('# a\nx = 1\r\n', '\r\n'),
+                              ('# a\rx = 1\r', '\r')]:
+            self.assertEqual(Context._split_comments(code, linesep),  # pylint: disable=protected-access
+                             BaseContext.split_comments(code, linesep), repr(code))
+
+        for code in ['', ' \t', '\n', '\r\n', 'x', ' \t\n x = 1\r\n', '\fx\f',
+                     '# comment\n', '\r\n# a\r\nx\r\n\r\n']:
+            self.assertEqual(Context._extract_whitespaces(code),  # pylint: disable=protected-access
+                             BaseContext.extract_whitespaces(code), repr(code))
 
     def test_decorator(self):
         @decorator('a')
@@ -136,6 +283,27 @@ class TestPoseur(unittest.TestCase):
         # right code
         func(1, b=2, c=3)
 
+    def test_decorator_template(self):
+        # poseur.decorator must stay the code rendered from the template, apart from
+        # type annotations and the local import (poseur imports functools globally)
+        def normalize(code):
+            tree = ast.parse(textwrap.dedent(code))
+            docstrings = []
+            for node in ast.walk(tree):
+                if isinstance(node, ast.arg):
+                    node.annotation = None
+                if isinstance(node, ast.FunctionDef):
+                    node.returns = None
+                    docstring = ast.get_docstring(node)
+                    if docstring is not None:
+                        docstrings.append(docstring)
+                        node.body = node.body[1:]
+                    node.body = [stmt for stmt in node.body if not isinstance(stmt, ast.Import)]
+            return ast.dump(tree), docstrings
+
+        rendered = '\n'.join(_decorator) % dict(decorator='decorator', indentation='    ')
+        self.assertEqual(normalize(inspect.getsource(decorator)), normalize(rendered))
+
     def test_async(self):
         src = 'async def func(param, /): pass'
         dst = 'async def func(param): pass'
@@ -209,6 +377,68 @@ class TestPoseur(unittest.TestCase):
             POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
         self._check_convert(src, dst)
 
+        # poseur in annotation
+        src = 'def func(a: (lambda x, /: x), /): pass'
+        dst = "%s\n\n\n@_poseur_decorator('a')\ndef func(a: (_poseur_decorator('x')(lambda x: x))): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+        # poseur in annotation with default value
+        src = 'def func(a: (lambda x, /: x) = 1, /): pass'
+        dst = "%s\n\n\n@_poseur_decorator('a')\ndef func(a: (_poseur_decorator('x')(lambda x: x)) = 1): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+        # poseur only in annotation
+        src = 'def func(a: (lambda x, /: x), b): pass'
+        dst = "%s\n\n\ndef func(a: (_poseur_decorator('x')(lambda x: x)), b): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+        # commas in default values
+        src = "def func(a=' , ', b=(1,  2), /): pass"
+        dst = "%s\n\n\n@_poseur_decorator('a', 'b')\ndef func(a=' , ', b=(1,  2)): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+        # comment after the removed operator
+        src = 'def func(a, / # comment\n, b): pass'
+        dst = "%s\n\n\n@_poseur_decorator('a')\ndef func(a  # comment\n, b): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+        # comment before the removed operator
+        src = 'def func(a, # comment\n  /, b): pass'
+        dst = "%s\n\n\n@_poseur_decorator('a')\ndef func(a # comment\n, b): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+        # backslash continuation after the removed operator
+        src = 'def func(a, /\\\n, b): pass'
+        dst = "%s\n\n\n@_poseur_decorator('a')\ndef func(a \\\n, b): pass" % (
+            POSEUR_LINESEP.join(_decorator) % dict(decorator='_poseur_decorator', indentation='\t'.expandtabs(4))).lstrip()
+        self._check_convert(src, dst)
+
+    def test_linesep(self):
+        path = os.path.join(self.tempdir, 'test_linesep.py')
+        for linesep in ['\r', '\r\n']:
+            src = 'def func(a, /):%s    pass%s' % (linesep, linesep)
+            dst = "%s%s@_poseur_decorator('a')%sdef func(a):%s    pass%s" % (
+                (linesep.join(_decorator) % dict(decorator='_poseur_decorator',
+                                                 indentation='\t'.expandtabs(4))).lstrip(),
+                linesep * 3, linesep, linesep, linesep)
+            self.assertEqual(convert(src, linesep=linesep), dst)
+
+            # detected from the file content
+            with open(path, 'wb') as file:
+                file.write(src.encode())
+            with mock.patch.dict(os.environ):
+                del os.environ['POSEUR_LINESEP']
+                core_func(path)
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), dst.encode())
+        os.remove(path)
+
 
 if __name__ == '__main__':
     unittest.main()